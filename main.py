@@ -1,11 +1,22 @@
 import argparse
-import json
+import contextlib
+import functools
 import logging
+import re
+import threading
 import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 
 import mysql.connector
-from mysql.connector.pooling import PooledMySQLConnection
-from mysql.connector.abstracts import MySQLConnectionAbstract, MySQLCursorAbstract
+from mysql.connector import HAVE_CEXT
+from mysql.connector.pooling import CNX_POOL_MAXSIZE, MySQLConnectionPool
+from mysql.connector.abstracts import MySQLCursorAbstract
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +28,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
+REPLAY_BATCH_SIZE = 2000
+REPLAY_UPDATE_ROWS = 500
+PROGRESS_LOG_EVERY = 100
+COPY_ROWS_PER_COMMIT = 10000
+SECONDARY_INDEX_RE = re.compile(r'^\s*(KEY `((?:[^`]|``)+)` .*?),?$')
+
+
+def quote_identifier(name: str) -> str:
+    return f"`{name.replace('`', '``')}`"
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def workers_count(value: str) -> int:
+    workers = int(value)
+    if not 1 <= workers <= CNX_POOL_MAXSIZE:
+        raise argparse.ArgumentTypeError(f"must be between 1 and {CNX_POOL_MAXSIZE}")
+    return workers
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    number = float(value)
+    if not number >= 0:
+        raise argparse.ArgumentTypeError("must not be negative")
+    return number
+
+
+def get_id_runs(ids: set[int]) -> list[tuple[int, int]]:
+    runs: list[tuple[int, int]] = []
+    for id_ in sorted(ids):
+        if runs and runs[-1][1] == id_ - 1:
+            runs[-1] = (runs[-1][0], id_)
+        else:
+            runs.append((id_, id_))
+    return runs
+
+
+def build_update_sql(table: str, columns: tuple[str, ...], rows: int) -> str:
+    cases = ' '.join(['WHEN %s THEN %s'] * rows)
+    set_str = ', '.join([f"{quote_identifier(col)} = CASE id {cases} END" for col in columns])
+    placeholders = ', '.join(['%s'] * rows)
+    return f"UPDATE {table} SET {set_str} WHERE id IN ({placeholders})"
+
+
+@functools.lru_cache(maxsize=1)
+def build_full_update_sql(table: str, columns: tuple[str, ...]) -> str:
+    # only full slices repeat; the tail slice of each batch has an arbitrary size and is built uncached
+    return build_update_sql(table, columns, REPLAY_UPDATE_ROWS)
+
 
 class MigrateService:
     def __init__(
@@ -29,6 +98,11 @@ class MigrateService:
         table: str,
         alter: list[str],
         chunk_size: int,
+        replay_batch_size: int,
+        workers: int,
+        chunk_sleep: float,
+        compress: bool,
+        resume: bool,
         swap_tables: bool,
         drop_old_table: bool,
         drop_triggers: bool,
@@ -42,209 +116,533 @@ class MigrateService:
         self.table: str = table
         self.alter: list[str] = alter
         self.chunk_size: int = chunk_size
+        self.replay_batch_size: int = replay_batch_size
+        self.workers: int = workers
+        self.chunk_sleep: float = chunk_sleep
+        self.compress: bool = compress
+        self.resume: bool = resume
         self.swap_tables: bool = swap_tables
         self.drop_old_table: bool = drop_old_table
         self.drop_triggers: bool = drop_triggers
         self.drop_audit_table: bool = drop_audit_table
-        self.cnx: PooledMySQLConnection | MySQLConnectionAbstract = mysql.connector.connect(
-            user=self.username,
-            password=self.password,
-            host=self.host,
-            port=self.port,
-            database=self.database,
-            autocommit=True,
-        )
-        self.cursor: MySQLCursorAbstract = self.cnx.cursor()
+        self.db_config: dict = {
+            'user': self.username,
+            'password': self.password,
+            'host': self.host,
+            'port': self.port,
+            'database': self.database,
+            'autocommit': True,
+            'use_pure': not HAVE_CEXT,
+            'compress': self.compress,
+        }
+        if not HAVE_CEXT:
+            logger.warning('MySQL C extension is not available, falling back to the pure Python driver.')
+        self.pool: MySQLConnectionPool | None = None
         self.audit_table_name: str = f'_{self.table}_audit'
         self.shadow_table_name: str = f"_{self.table}_new"
-        self.temp_table: str = 'temp_copied_ids'
+        self.progress_table_name: str = f"_{self.table}_osc_progress"
+        self.indexes_table_name: str = f"_{self.table}_osc_indexes"
+        self.old_table_name: str = f"{self.table}_old"
         self.s_time: float = time.perf_counter()
 
-    def _get_table_columns(self) -> list[str]:
-        self.cursor.execute(f"""
-            SELECT COLUMN_NAME
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_NAME = '{self.table}' AND TABLE_SCHEMA = '{self.database}'
-        """)
-        return [col[0] for col in self.cursor.fetchall()]
-
-    def _create_audit_table(self) -> None:
-        logger.info('Creating audit table...')
-        self.cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS {self.audit_table_name} (
+    def _create_pool(self) -> None:
+        # connections are opened up front; session state is restored by whoever changes it
+        self.pool = MySQLConnectionPool(
+            pool_name='osc',
+            pool_size=max(4, self.workers),
+            pool_reset_session=False,
+            **self.db_config,
+        )
+
+    def _close_pool(self) -> None:
+        # the pool has no public way to close its idle connections; _remove_connections() is
+        # relied on for mysql-connector-python 9.0.0, pinned in the Pipfile and the Dockerfile
+        self.pool._remove_connections()
+        self.pool = None
+
+    @contextlib.contextmanager
+    def _cursor(self) -> Iterator[MySQLCursorAbstract]:
+        with self.pool.get_connection() as cnx:
+            cursor = cnx.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @functools.cached_property
+    def _columns(self) -> list[str]:
+        with self._cursor() as cursor:
+            cursor.execute(f"SHOW COLUMNS FROM {quote_identifier(self.table)}")
+            return [col[0] for col in cursor.fetchall()]
+
+    @functools.cached_property
+    def _shared_columns(self) -> list[str]:
+        # only valid once the shadow table has been created and altered
+        with self._cursor() as cursor:
+            cursor.execute(f"SHOW COLUMNS FROM {quote_identifier(self.shadow_table_name)}")
+            shadow_columns = {col[0] for col in cursor.fetchall()}
+        return [col for col in self._columns if col in shadow_columns]
+
+    def _get_unique_keys(self, table: str) -> set[tuple[tuple, ...]]:
+        # a key part is its column, prefix length, type and collation: an ALTER changing any of
+        # them can make values that were distinct in the source collide in the shadow table
+        with self._cursor() as cursor:
+            cursor.execute(f"SHOW FULL COLUMNS FROM {quote_identifier(table)}")
+            column_types = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+            cursor.execute(f"SHOW INDEX FROM {quote_identifier(table)}")
+            rows = cursor.fetchall()
+        keys: dict[str, list[tuple]] = {}
+        for row in rows:
+            non_unique, key_name, column_name, sub_part = row[1], row[2], row[4], row[7]
+            if not non_unique:
+                keys.setdefault(key_name, []).append((column_name, sub_part, *column_types.get(column_name, (None, None))))
+        return {tuple(parts) for parts in keys.values()}
+
+    def _execute_ddl(self, statements: list[str]) -> None:
+        # one round trip for the whole batch, results are drained to surface errors
+        with self._cursor() as cursor:
+            for _ in cursor.execute(';\n'.join(statements), multi=True):
+                pass
+
+    def _audit_table_ddl(self) -> list[str]:
+        return [f"""
+            CREATE TABLE IF NOT EXISTS {quote_identifier(self.audit_table_name)} (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 action VARCHAR(10),
                 original_id INT,
-                row_data JSON,
+                row_data JSON NULL,
                 action_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-        """)
-        logger.info(f"Audit table {self.audit_table_name} created.")
-
-    def _add_triggers(self) -> None:
-        logger.info('Creating triggers...')
-        
-        columns = self._get_table_columns()
-        set_columns = ', '.join([f"'{col}', NEW.{col}" for col in columns])
-        old_set_columns = ', '.join([f"'{col}', OLD.{col}" for col in columns]) 
-
-        self.cursor.execute(f"""
-            CREATE TRIGGER {self.table}_insert AFTER INSERT ON {self.table}
+        """]
+
+    def _triggers_ddl(self) -> list[str]:
+        table = quote_identifier(self.table)
+        audit_table = quote_identifier(self.audit_table_name)
+        set_columns = ', '.join([
+            f"{quote_literal(col)}, NEW.{quote_identifier(col)}" for col in self._columns
+        ])
+
+        # inserts and deletes are replayed by id, only updates need the row payload
+        return [
+            f"""
+            CREATE TRIGGER {quote_identifier(f"{self.table}_insert")} AFTER INSERT ON {table}
             FOR EACH ROW
-            INSERT INTO {self.audit_table_name} (action, original_id, row_data) 
+            INSERT INTO {audit_table} (action, original_id) 
             VALUES (
                 'INSERT',
-                NEW.id,
-                JSON_OBJECT({set_columns})
-            );
-        """)
-
-        self.cursor.execute(f"""
-            CREATE TRIGGER {self.table}_update AFTER UPDATE ON {self.table}
+                NEW.id
+            )
+            """,
+            f"""
+            CREATE TRIGGER {quote_identifier(f"{self.table}_update")} AFTER UPDATE ON {table}
             FOR EACH ROW
-            INSERT INTO {self.audit_table_name} (action, original_id, row_data) 
+            INSERT INTO {audit_table} (action, original_id, row_data) 
             VALUES (
                 'UPDATE',
                 OLD.id,
                 JSON_OBJECT({set_columns})
-            );
-        """)
-
-        self.cursor.execute(f"""
-            CREATE TRIGGER {self.table}_delete AFTER DELETE ON {self.table}
+            )
+            """,
+            f"""
+            CREATE TRIGGER {quote_identifier(f"{self.table}_delete")} AFTER DELETE ON {table}
             FOR EACH ROW
-            INSERT INTO {self.audit_table_name} (action, original_id, row_data) 
+            INSERT INTO {audit_table} (action, original_id) 
             VALUES (
                 'DELETE',
-                OLD.id,
-                JSON_OBJECT('old', JSON_OBJECT({old_set_columns}))
-            );
-        """)
-        
-        logger.info(f"Triggers for table {self.table} created.")
+                OLD.id
+            )
+            """,
+        ]
+
+    def _shadow_table_ddl(self) -> list[str]:
+        shadow_table = quote_identifier(self.shadow_table_name)
+        return [f"CREATE TABLE {shadow_table} LIKE {quote_identifier(self.table)}"] + [
+            f"ALTER TABLE {shadow_table} {alter_command}"
+            for alter_command in self.alter
+            if alter_command.strip()
+        ]
 
-    def _create_shadow_table(self) -> None:
-        logger.info('Creating shadow table...')
+    def _progress_table_ddl(self) -> list[str]:
+        return [f"""
+            CREATE TABLE {quote_identifier(self.progress_table_name)} (
+                range_start BIGINT PRIMARY KEY,
+                range_end BIGINT NOT NULL,
+                last_id BIGINT NOT NULL
+            )
+        """]
+
+    def _indexes_table_ddl(self) -> list[str]:
+        return [f"""
+            CREATE TABLE {quote_identifier(self.indexes_table_name)} (
+                name VARCHAR(64) PRIMARY KEY,
+                definition TEXT NOT NULL
+            )
+        """]
 
-        self.cursor.execute(f"CREATE TABLE {self.shadow_table_name} LIKE {self.table}")
-        for alter_command in self.alter:
-            self.cursor.execute(f"ALTER TABLE {self.shadow_table_name} {alter_command}")
+    def _defer_secondary_indexes(self) -> None:
+        with self._cursor() as cursor:
+            cursor.execute(f"SHOW CREATE TABLE {quote_identifier(self.shadow_table_name)}")
+            create_table = cursor.fetchone()[1]
+            if 'FOREIGN KEY' in create_table:
+                # foreign keys need their supporting indexes, keep everything in place
+                return
 
-        logger.info(f"Shadow table {self.shadow_table_name} created and altered.")
+            indexes = [
+                (match.group(2).replace('``', '`'), match.group(1))
+                for match in map(SECONDARY_INDEX_RE.match, create_table.splitlines())
+                if match
+            ]
+            if not indexes:
+                return
+
+            logger.info(f"Deferring {len(indexes)} secondary indexes of {self.shadow_table_name} until after the copy...")
+            # saved first, so --resume can still rebuild them
+            cursor.executemany(
+                f"INSERT INTO {quote_identifier(self.indexes_table_name)} (name, definition) VALUES (%s, %s)",
+                indexes,
+            )
+            drop_str = ', '.join([f"DROP INDEX {quote_identifier(name)}" for name, _ in indexes])
+            cursor.execute(f"ALTER TABLE {quote_identifier(self.shadow_table_name)} {drop_str}")
+
+    def _restore_secondary_indexes(self) -> None:
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT name, definition FROM {quote_identifier(self.indexes_table_name)}")
+            saved = cursor.fetchall()
+            if not saved:
+                return
+
+            # a resumed run may find some indexes already present, e.g. after an interrupted deferral
+            cursor.execute(f"SHOW INDEX FROM {quote_identifier(self.shadow_table_name)}")
+            existing = {row[2] for row in cursor.fetchall()}
+            definitions = [definition for name, definition in saved if name not in existing]
+            if not definitions:
+                cursor.execute(f"DELETE FROM {quote_identifier(self.indexes_table_name)}")
+                return
+
+            logger.info(f"Rebuilding {len(definitions)} secondary indexes of {self.shadow_table_name}...")
+            # one ALTER, so InnoDB sorts the copied rows once for all indexes
+            add_str = ', '.join([f"ADD {definition}" for definition in definitions])
+            cursor.execute(f"ALTER TABLE {quote_identifier(self.shadow_table_name)} {add_str}")
+            cursor.execute(f"DELETE FROM {quote_identifier(self.indexes_table_name)}")
+            logger.info(f"Secondary indexes of {self.shadow_table_name} rebuilt.")
+
+    def _get_copy_ranges(self) -> list[tuple[int, int, int]]:
+        with self._cursor() as cursor:
+            cursor.execute(f"SELECT range_start, range_end, last_id FROM {quote_identifier(self.progress_table_name)}")
+            ranges = cursor.fetchall()
+            if ranges:
+                logger.info(f"Resuming copy of {len(ranges)} ranges from {self.progress_table_name}")
+                return ranges
+
+            cursor.execute(f"SELECT MIN(id), MAX(id) FROM {quote_identifier(self.table)}")
+            min_id, max_id = cursor.fetchone()
+
+            if not min_id or not max_id:
+                return []
+
+            logger.info(f"Copying data from ID {min_id} to {max_id}")
+
+            # every worker copies its own disjoint id range on its own connection
+            step = (max_id - min_id) // self.workers + 1
+            ranges = [(start, min(start + step - 1, max_id), start - 1) for start in range(min_id, max_id + 1, step)]
+            cursor.executemany(
+                f"INSERT INTO {quote_identifier(self.progress_table_name)} (range_start, range_end, last_id) VALUES (%s, %s, %s)",
+                ranges,
+            )
+            return ranges
 
     def _copy_data(self) -> None:
         logger.info('Copying data to shadow table...')
-        
-        # self.cursor.execute(f"CREATE TEMPORARY TABLE {self.temp_table} (id INT unsigned PRIMARY KEY)")
-        
-        self.cursor.execute(f"SELECT MIN(id), MAX(id) FROM {self.table}")
-        min_id, max_id = self.cursor.fetchone()
-        
-        if not min_id or not max_id:
+
+        ranges = self._get_copy_ranges()
+        if not ranges:
             logger.info("No data found in the source table.")
             return
 
-        logger.info(f"Copying data from ID {min_id} to {max_id}")
-        
-        current_id = min_id
-        while current_id <= max_id:
-            end_id: int = min(current_id + self.chunk_size - 1, max_id)
-            self.cursor.execute(f"""
-                INSERT INTO {self.shadow_table_name} 
-                SELECT * FROM {self.table}
-                WHERE id BETWEEN {current_id} AND {end_id}
-            """)
-            # self.cursor.execute(f"""
-            #     INSERT IGNORE INTO {self.temp_table} 
-            #     SELECT id FROM {self.table}
-            #     WHERE id BETWEEN {current_id} AND {end_id}
-            # """)
-            
-            current_id = end_id + 1
-            
-            logger.info(f"Copied rows from ID {current_id - self.chunk_size} to {end_id}...")
+        columns_str = ', '.join(map(quote_identifier, self._shared_columns))
+        # keyset pagination: each chunk is the next chunk_size ids, however sparse
+        boundary_sql = f"""
+            SELECT MAX(id) FROM (
+                SELECT id FROM {quote_identifier(self.table)}
+                WHERE id > %s AND id <= %s
+                ORDER BY id
+                LIMIT %s
+            ) AS chunk
+        """
+        copy_sql = f"""
+            INSERT INTO {quote_identifier(self.shadow_table_name)} ({columns_str})
+            SELECT {columns_str} FROM {quote_identifier(self.table)}
+            WHERE id > %s AND id <= %s
+        """
+        progress_sql = (
+            f"REPLACE INTO {quote_identifier(self.progress_table_name)} (range_start, range_end, last_id) "
+            f"VALUES (%s, %s, %s)"
+        )
+
+        # rows already satisfy every unique key the source has with the same columns, prefixes,
+        # types and collations, so checks are only needed for new or changed ones
+        skip_unique_checks = self._get_unique_keys(self.shadow_table_name) <= self._get_unique_keys(self.table)
+        if skip_unique_checks:
+            logger.info('Shadow table adds or changes no unique keys, copying with unique_checks disabled.')
+
+        stop_copy = threading.Event()
+        copy_range = functools.partial(
+            self._copy_range,
+            boundary_sql=boundary_sql,
+            copy_sql=copy_sql,
+            progress_sql=progress_sql,
+            skip_unique_checks=skip_unique_checks,
+            stop_copy=stop_copy,
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(copy_range, *copy_args) for copy_args in ranges]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    # the other ranges stop at their next chunk instead of copying to the end
+                    stop_copy.set()
+                    future.result()
 
         logger.info('Data copied successfully to the shadow table.')
 
+    def _copy_range(
+        self,
+        start_id: int,
+        end_id: int,
+        last_id: int,
+        boundary_sql: str,
+        copy_sql: str,
+        progress_sql: str,
+        skip_unique_checks: bool,
+        stop_copy: threading.Event,
+    ) -> None:
+        with self.pool.get_connection() as cnx:
+            cursor = cnx.cursor(buffered=True)
+            try:
+                if skip_unique_checks:
+                    cursor.execute("SET SESSION unique_checks = 0")
+                # group chunks into one transaction, the progress row commits together with its data
+                chunks_per_commit = max(1, COPY_ROWS_PER_COMMIT // self.chunk_size)
+                chunks = copied = 0
+                stopped = False
+                while last_id < end_id:
+                    if stop_copy.is_set():
+                        stopped = True
+                        break
+                    if not cnx.in_transaction:
+                        cnx.start_transaction()
+                    cursor.execute(boundary_sql, (last_id, end_id, self.chunk_size))
+                    chunk_end_id = cursor.fetchone()[0]
+                    if chunk_end_id is None:
+                        break
+                    cursor.execute(copy_sql, (last_id, chunk_end_id))
+                    copied += cursor.rowcount
+                    cursor.execute(progress_sql, (start_id, end_id, chunk_end_id))
+
+                    chunks += 1
+                    if chunks % PROGRESS_LOG_EVERY == 0:
+                        logger.info("Copied %d rows from ID %d to %d...", copied, start_id, chunk_end_id)
+
+                    last_id = chunk_end_id
+                    if chunks % chunks_per_commit == 0:
+                        cnx.commit()
+                        if self.chunk_sleep:
+                            time.sleep(self.chunk_sleep)
+                if cnx.in_transaction:
+                    cnx.commit()
+
+                if stopped:
+                    logger.info("Stopped copying IDs %d to %d at ID %d after %d rows.", start_id, end_id, last_id, copied)
+                else:
+                    logger.info("Copied %d rows from ID %d to %d.", copied, start_id, end_id)
+            except mysql.connector.Error:
+                cnx.rollback()
+                raise
+            finally:
+                if skip_unique_checks:
+                    # pooled connections keep their session state; a failed restore, e.g. on a lost
+                    # connection, is logged so it does not replace the error being raised
+                    try:
+                        cursor.execute("SET SESSION unique_checks = 1")
+                    except mysql.connector.Error as err:
+                        logger.warning(f"Could not restore unique_checks on a copy connection: {err}")
+                cursor.close()
+
     def _replay_audit_logs(self) -> None:
         logger.info('Replaying audit logs...')
 
-        self.cursor.execute(f"SELECT * FROM {self.audit_table_name}")
-        audit_logs = self.cursor.fetchall()
-        columns = self._get_table_columns()
-        
-        
-        for log in audit_logs:
-            action, original_id, row_data = log[1], log[2], json.loads(log[3])
-            if action == 'INSERT':
-                self.cursor.execute(f"INSERT INTO {self.shadow_table_name} SELECT * FROM {self.table} WHERE id = {original_id}")
-            elif action == 'UPDATE':
-                columns_str = ', '.join(columns)
-                new_values_str = ', '.join([f"'{row_data.get(col, '')}'" for col in columns])
-                update_str = ', '.join([f"{col} = VALUES({col})" for col in columns if col != 'id'])
-                
-                insert_query = f"""
-                    INSERT INTO {self.shadow_table_name} ({columns_str})
-                    VALUES ({new_values_str})
-                    ON DUPLICATE KEY UPDATE {update_str}
-                """
-                self.cursor.execute(insert_query)
-            elif action == 'DELETE':
-                self.cursor.execute(f"DELETE FROM {self.shadow_table_name} WHERE id = {original_id}")
-            self.cursor.execute(f"DELETE FROM {self.audit_table_name} WHERE id = {log[0]}")
-        
+        columns_str = ', '.join(map(quote_identifier, self._shared_columns))
+        # every batch starts again at the head of the primary key: replayed ids are purged, and an id
+        # from a transaction that commits late is picked up instead of being skipped as a gap
+        select_sql = (
+            f"SELECT id, action, original_id, row_data FROM {quote_identifier(self.audit_table_name)} "
+            f"WHERE id <= %s ORDER BY id LIMIT %s"
+        )
+        copy_sql = (
+            f"INSERT INTO {quote_identifier(self.shadow_table_name)} ({columns_str}) "
+            f"SELECT {columns_str} FROM {quote_identifier(self.table)} WHERE "
+        )
+
+        with self.pool.get_connection() as cnx:
+            # dedicated unbuffered cursor, so at most one batch of logs is held in memory
+            audit_cursor: MySQLCursorAbstract = cnx.cursor(buffered=False)
+            cursor: MySQLCursorAbstract = cnx.cursor()
+            try:
+                # replay up to a fixed snapshot, a busy table would otherwise keep the loop running forever
+                cursor.execute(f"SELECT MAX(id) FROM {quote_identifier(self.audit_table_name)}")
+                max_audit_id = cursor.fetchone()[0] or 0
+                while True:
+                    audit_cursor.execute(select_sql, (max_audit_id, self.replay_batch_size))
+                    audit_logs = audit_cursor.fetchall()
+                    if not audit_logs:
+                        break
+
+                    # collapse the batch to the last action per row
+                    inserts: set[int] = set()
+                    updates: dict[int, dict] = {}
+                    deletes: set[int] = set()
+                    for log in audit_logs:
+                        action, original_id = log[1], log[2]
+                        if action == 'INSERT':
+                            updates.pop(original_id, None)
+                            inserts.add(original_id)
+                        elif action == 'UPDATE':
+                            # an insert copies the current source row, which already has this update
+                            if original_id not in inserts:
+                                updates[original_id] = json_loads(log[3])
+                        elif action == 'DELETE':
+                            inserts.discard(original_id)
+                            updates.pop(original_id, None)
+                            deletes.add(original_id)
+
+                    if deletes:
+                        placeholders = ', '.join(['%s'] * len(deletes))
+                        cursor.execute(
+                            f"DELETE FROM {quote_identifier(self.shadow_table_name)} WHERE id IN ({placeholders})",
+                            tuple(deletes),
+                        )
+                    if inserts:
+                        runs = get_id_runs(inserts)
+                        if len(runs) * 2 <= len(inserts):
+                            # mostly consecutive ids, typically auto increment inserts: copy whole ranges
+                            ranges_str = ' OR '.join(['id BETWEEN %s AND %s'] * len(runs))
+                            cursor.execute(f"{copy_sql}{ranges_str}", [id_ for run in runs for id_ in run])
+                        else:
+                            placeholders = ', '.join(['%s'] * len(inserts))
+                            cursor.execute(f"{copy_sql}id IN ({placeholders})", tuple(inserts))
+                    if updates:
+                        self._apply_updates(cursor, updates)
+                    # only the ids actually read: a lower id from a still open transaction may not be visible yet
+                    audit_ids = [log[0] for log in audit_logs]
+                    placeholders = ', '.join(['%s'] * len(audit_ids))
+                    cursor.execute(
+                        f"DELETE FROM {quote_identifier(self.audit_table_name)} WHERE id IN ({placeholders})",
+                        audit_ids,
+                    )
+
+                    logger.info(f"Replayed {len(audit_logs)} audit logs up to ID {audit_ids[-1]}...")
+            finally:
+                audit_cursor.close()
+                cursor.close()
+
         logger.info(f"Audit logs replayed and applied to {self.shadow_table_name}.")
 
-    def _swap_tables(self) -> None:
-        logger.info('Swapping tables...')
-        self.cursor.execute(f"RENAME TABLE {self.table} TO {self.table}_old, {self.shadow_table_name} TO {self.table}")
-        logger.info(f"Tables swapped: {self.table} with {self.shadow_table_name}.")
-
-    def _drop_old_table(self) -> None:
-        logger.info('Dropping old table...')
-        self.cursor.execute(f"DROP TABLE {self.table}_old")
-        logger.info(f"Old table {self.table}_old dropped.")
-
-    def _drop_triggers(self) -> None:
-        logger.info('Dropping triggers...')
-        self.cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_insert")
-        self.cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_update")
-        self.cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_delete")
-        logger.info(f"Triggers for table {self.table} dropped.")
-    
-    def _drop_audit_table(self) -> None:
-        logger.info('Dropping audit table...')
-        self.cursor.execute(f"DROP TABLE {self.audit_table_name}")
-        logger.info(f"Audit table {self.audit_table_name} dropped.")
+    def _apply_updates(self, cursor: MySQLCursorAbstract, updates: dict[int, dict]) -> None:
+        # one multi-row UPDATE per slice, CASE picks each row's values by id
+        set_columns = tuple(col for col in self._shared_columns if col != 'id')
+        if not set_columns:
+            return
+
+        rows = list(updates.items())
+        for i in range(0, len(rows), REPLAY_UPDATE_ROWS):
+            chunk = rows[i:i + REPLAY_UPDATE_ROWS]
+            params = [
+                value
+                for col in set_columns
+                for original_id, row_data in chunk
+                for value in (original_id, row_data.get(col))
+            ]
+            params += [original_id for original_id, _ in chunk]
+            table = quote_identifier(self.shadow_table_name)
+            if len(chunk) == REPLAY_UPDATE_ROWS:
+                sql = build_full_update_sql(table, set_columns)
+            else:
+                sql = build_update_sql(table, set_columns, len(chunk))
+            cursor.execute(sql, params)
+
+    def _swap_tables_ddl(self) -> list[str]:
+        table = quote_identifier(self.table)
+        return [
+            f"RENAME TABLE {table} TO {quote_identifier(self.old_table_name)}, "
+            f"{quote_identifier(self.shadow_table_name)} TO {table}"
+        ]
+
+    def _drop_old_table_ddl(self) -> list[str]:
+        return [f"DROP TABLE {quote_identifier(self.old_table_name)}"]
+
+    def _drop_triggers_ddl(self) -> list[str]:
+        return [
+            f"DROP TRIGGER IF EXISTS {quote_identifier(f'{self.table}_insert')}",
+            f"DROP TRIGGER IF EXISTS {quote_identifier(f'{self.table}_update')}",
+            f"DROP TRIGGER IF EXISTS {quote_identifier(f'{self.table}_delete')}",
+        ]
+
+    def _drop_progress_table_ddl(self) -> list[str]:
+        return [f"DROP TABLE {quote_identifier(self.progress_table_name)}"]
+
+    def _drop_indexes_table_ddl(self) -> list[str]:
+        return [f"DROP TABLE {quote_identifier(self.indexes_table_name)}"]
+
+    def _drop_audit_table_ddl(self) -> list[str]:
+        return [f"DROP TABLE {quote_identifier(self.audit_table_name)}"]
     
     def execute(self) -> None:        
         try:
-            self._create_audit_table()
-            self._add_triggers()
-            self._create_shadow_table()
+            self._create_pool()
+            if not self.resume:
+                logger.info('Creating audit table, triggers, shadow table and progress table...')
+                self._execute_ddl(
+                    self._audit_table_ddl()
+                    + self._triggers_ddl()
+                    + self._shadow_table_ddl()
+                    + self._progress_table_ddl()
+                    + self._indexes_table_ddl()
+                )
+                logger.info(f"Audit table {self.audit_table_name}, triggers for table {self.table}, "
+                            f"shadow table {self.shadow_table_name} and progress table {self.progress_table_name} created.")
+                self._defer_secondary_indexes()
             self._copy_data()
+            self._restore_secondary_indexes()
             self._replay_audit_logs()
+
+            teardown: list[str] = []
             if self.swap_tables:
-                self._swap_tables()
+                logger.info(f"Swapping tables: {self.table} with {self.shadow_table_name}.")
+                teardown += self._swap_tables_ddl()
             if self.drop_triggers:
-                logger.info('dropped triggers')
-                self._drop_triggers()
+                logger.info(f"Dropping triggers for table {self.table}.")
+                teardown += self._drop_triggers_ddl()
             if self.swap_tables and self.drop_old_table:
-                self._drop_old_table()
-            if self.audit_table_name:
-                logger.info('dropped audit')
-                self._drop_audit_table()
+                logger.info(f"Dropping old table {self.old_table_name}.")
+                teardown += self._drop_old_table_ddl()
+            if self.drop_audit_table and self.drop_triggers:
+                logger.info(f"Dropping audit table {self.audit_table_name}.")
+                teardown += self._drop_audit_table_ddl()
+            elif self.drop_audit_table:
+                # the triggers still write into it, every write to the table would fail
+                logger.warning(f"Keeping audit table {self.audit_table_name}: its triggers are not being dropped.")
+            teardown += self._drop_progress_table_ddl()
+            teardown += self._drop_indexes_table_ddl()
+            self._execute_ddl(teardown)
             # TODO: is new table is similar to old
             # TODO: index?
-            # TODO: drop temp table
-            # TODO: resume by temp table data
             logger.info("Migration completed successfully.")
         except mysql.connector.Error as err:
             logger.error(f"Error: {err}", exc_info=True)
         finally:
-            self.cursor.close()
-            self.cnx.close()
-            logger.info('Database connection closed.')
+            if self.pool is not None:
+                self._close_pool()
+                logger.info('Database connections closed.')
             logger.info(f'Spend {round(time.perf_counter() - self.s_time, 3)}')
 
 if __name__ == "__main__":
@@ -256,7 +654,12 @@ if __name__ == "__main__":
     parser.add_argument('--alter', required=True, help='Alter command to apply to the new table')
     parser.add_argument('--user', required=True, help='MySQL user')
     parser.add_argument('--password', required=True, help='MySQL password')
-    parser.add_argument('--chunk-size', type=int, required=True, dest='chunk_size', default=1000, help='Copy chunk size')
+    parser.add_argument('--chunk-size', type=positive_int, required=True, dest='chunk_size', default=1000, help='Copy chunk size')
+    parser.add_argument('--replay-batch-size', type=positive_int, dest='replay_batch_size', default=REPLAY_BATCH_SIZE, help='Audit logs replayed per batch')
+    parser.add_argument('--workers', type=workers_count, default=4, help='Parallel copy workers, each with its own connection')
+    parser.add_argument('--chunk-sleep', type=non_negative_float, dest='chunk_sleep', default=0.0, help='Seconds to sleep after each copy commit, e.g. to let replicas catch up')
+    parser.add_argument('--compress', action=argparse.BooleanOptionalAction, default=True, help='Use protocol compression')
+    parser.add_argument('--resume', action='store_true', default=False, help='Resume an interrupted copy from the progress table')
     parser.add_argument('--swap-tables', action='store_true', default=False, help='Swap tables after migration')
     parser.add_argument('--drop-old-table', action='store_true', default=False, help='Drop old table after swapping')
     parser.add_argument('--drop-triggers', action='store_true', default= False, help='Drop triggers after migration')
@@ -274,6 +677,11 @@ if __name__ == "__main__":
         table=args.table,
         alter=args.alter.split(';'),
         chunk_size=int(args.chunk_size),
+        replay_batch_size=args.replay_batch_size,
+        workers=args.workers,
+        chunk_sleep=args.chunk_sleep,
+        compress=args.compress,
+        resume=args.resume,
         swap_tables=args.swap_tables,
         drop_old_table=args.drop_old_table,
         drop_triggers=args.drop_triggers,